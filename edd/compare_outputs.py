@@ -7,10 +7,16 @@ Usage:
     python compare_outputs.py --task prospect_welcome_day0
 """
 
-import json
 import argparse
 from pathlib import Path
-from difflib import unified_diff, SequenceMatcher
+
+try:
+    from difflib_rs import unified_diff
+except ImportError:
+    from difflib import unified_diff
+
+from eval_runner import calculate_similarity
+from src.jsonio import dumps, iter_jsonl, loads
 
 
 class OutputComparer:
@@ -23,15 +29,12 @@ class OutputComparer:
     def load_data(self):
         """Load evaluation records and agent results."""
         # Load eval records
-        with open(self.evals_path, "r", encoding="utf-8") as f:
-            for line in f:
-                if line.strip():
-                    record = json.loads(line)
-                    self.eval_records[record["task_id"]] = record
+        for record in iter_jsonl(self.evals_path):
+            self.eval_records[record["task_id"]] = record
         
         # Load results
-        with open(self.results_path, "r", encoding="utf-8") as f:
-            results_list = json.load(f)
+        with open(self.results_path, "rb") as f:
+            results_list = loads(f.read())
             for result in results_list:
                 self.results[result["task_id"]] = result
     
@@ -63,18 +66,22 @@ class OutputComparer:
         lines.append("-" * 80)
         
         # Channel
+        exp_channel = exp_msg.get('channel')
+        act_channel = act_msg.get('channel')
         lines.append("\n🔹 Channel:")
-        lines.append(f"  Expected: {exp_msg.get('channel')}")
-        lines.append(f"  Actual:   {act_msg.get('channel')}")
-        match = exp_msg.get('channel') == act_msg.get('channel')
+        lines.append(f"  Expected: {exp_channel}")
+        lines.append(f"  Actual:   {act_channel}")
+        match = exp_channel == act_channel
         lines.append(f"  Status:   {'✅ MATCH' if match else '❌ MISMATCH'}")
         
         # Subject (if email)
-        if exp_msg.get('subject') or act_msg.get('subject'):
+        exp_subject = exp_msg.get('subject')
+        act_subject = act_msg.get('subject')
+        if exp_subject or act_subject:
             lines.append("\n🔹 Subject:")
-            lines.append(f"  Expected: {exp_msg.get('subject')}")
-            lines.append(f"  Actual:   {act_msg.get('subject')}")
-            similarity = self._calculate_similarity(exp_msg.get('subject', ''), act_msg.get('subject', ''))
+            lines.append(f"  Expected: {exp_subject}")
+            lines.append(f"  Actual:   {act_subject}")
+            similarity = calculate_similarity(exp_subject, act_subject)
             lines.append(f"  Similarity: {similarity:.1%}")
         
         # Body
@@ -91,10 +98,11 @@ class OutputComparer:
             lines.append(f"    {self._format_multiline(act_body or 'null', indent=4)}")
             
             if exp_body and act_body:
-                similarity = self._calculate_similarity(exp_body, act_body)
+                similarity = calculate_similarity(exp_body, act_body)
                 lines.append(f"  Similarity: {similarity:.1%}")
                 
-                if similarity < 1.0:
+                # Only build the diff when there is something to show
+                if exp_body != act_body:
                     lines.append("\n  📝 Differences:")
                     diff = self._generate_diff(exp_body, act_body)
                     lines.append(diff)
@@ -105,8 +113,8 @@ class OutputComparer:
         
         if exp_cta or act_cta:
             lines.append("\n🔹 CTA:")
-            lines.append(f"  Expected: {json.dumps(exp_cta, ensure_ascii=False)}")
-            lines.append(f"  Actual:   {json.dumps(act_cta, ensure_ascii=False)}")
+            lines.append(f"  Expected: {dumps(exp_cta)}")
+            lines.append(f"  Actual:   {dumps(act_cta)}")
             match = exp_cta.get('type') == act_cta.get('type')
             lines.append(f"  Type Match: {'✅' if match else '❌'}")
         
@@ -114,12 +122,13 @@ class OutputComparer:
         exp_action = expected.get("next_action", {}) or {}
         act_action = actual.get("next_action", {}) or {}
         
-        lines.append("\n⚡ NEXT ACTION")
-        lines.append("-" * 80)
-        lines.append(f"  Expected: {json.dumps(exp_action, ensure_ascii=False)}")
-        lines.append(f"  Actual:   {json.dumps(act_action, ensure_ascii=False)}")
-        match = exp_action.get('type') == act_action.get('type')
-        lines.append(f"  Type Match: {'✅' if match else '❌'}")
+        if exp_action or act_action:
+            lines.append("\n⚡ NEXT ACTION")
+            lines.append("-" * 80)
+            lines.append(f"  Expected: {dumps(exp_action)}")
+            lines.append(f"  Actual:   {dumps(act_action)}")
+            match = exp_action.get('type') == act_action.get('type')
+            lines.append(f"  Type Match: {'✅' if match else '❌'}")
         
         # Thresholds
         thresholds = eval_record.get("thresholds", {})
@@ -158,7 +167,7 @@ class OutputComparer:
             act_body = act_msg.get('body')
             
             if exp_body and act_body:
-                body_sim = self._calculate_similarity(exp_body, act_body)
+                body_sim = calculate_similarity(exp_body, act_body)
             else:
                 body_sim = 1.0 if (exp_body is None and act_body is None) else 0.0
             
@@ -172,14 +181,6 @@ class OutputComparer:
         
         return "\n".join(lines)
     
-    def _calculate_similarity(self, text1: str, text2: str) -> float:
-        """Calculate similarity ratio between two strings."""
-        if not text1 and not text2:
-            return 1.0
-        if not text1 or not text2:
-            return 0.0
-        return SequenceMatcher(None, text1, text2).ratio()
-    
     def _format_multiline(self, text: str, indent: int = 0) -> str:
         """Format multiline text with indentation."""
         if not text or text == 'null':
@@ -190,8 +191,9 @@ class OutputComparer:
     
     def _generate_diff(self, text1: str, text2: str) -> str:
         """Generate unified diff between two texts."""
-        lines1 = text1.splitlines(keepends=True)
-        lines2 = text2.splitlines(keepends=True)
+        # lineterm='' expects lines without their endings
+        lines1 = text1.splitlines()
+        lines2 = text2.splitlines()
         
         diff = unified_diff(lines1, lines2, lineterm='', fromfile='expected', tofile='actual')
         diff_lines = list(diff)
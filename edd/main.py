@@ -1,11 +1,15 @@
-import json
+import argparse
 import logging
+import queue
 import time
 import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 from dotenv import load_dotenv
 
 from src.agent import AutonomousAgent
+from src.ratelimit import RateLimiter
+from src.jsonio import count_jsonl, dumps_bytes, loads
 from src.validation import validate_response
 from eval_runner import EvalRunner
 
@@ -19,7 +23,95 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def _iter_records(path: Path):
+    """Yields (idx, record, error) for each non-blank line of an evals file.
+
+    A malformed line yields its parse error instead of ending the iteration, so a
+    bad record late in the file doesn't discard tasks that already ran.
+    """
+    idx = 0
+    with open(path, "rb") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            idx += 1
+            try:
+                yield idx, loads(line), None
+            except ValueError as e:
+                yield idx, None, f"Invalid JSON on line {lineno} of {path}: {e}"
+
+
+def _run_one(agents: queue.Queue, eval_runner: EvalRunner, record: dict, idx: int, total: int):
+    """Runs the agent and evaluation for one record on a worker thread.
+
+    Returns the result entry and the eval findings (None if the task errored).
+    """
+    task_id = record.get("task_id", "unknown")
+    print(f"🔹 Processing Task {idx}/{total}: {task_id}")
+
+    # Agents keep per-task trace state, so each worker borrows its own
+    agent = agents.get()
+    try:
+        # Execute agent
+        start_time = time.time()
+        output = agent.run_with_retries(record)
+        end_time = time.time()
+        
+        # Calculate metrics
+        latency_ms = (end_time - start_time) * 1000
+        
+        # Get token stats from tracer if available
+        metrics = {
+            "latency_ms": latency_ms,
+            # Turns replayed from the LLM cache; latency is not meaningful if any
+            "cached_turns": agent.cache_hits,
+            "personalization_score": 0,  # Will be calculated by eval_runner
+            "locale_accuracy": 0,  # Will be calculated by eval_runner
+            "safety_violations": 0
+        }
+
+        # Run comprehensive evaluation
+        findings = eval_runner.run_eval(record, output or {}, metrics)
+        
+        # Legacy validation for backward compatibility
+        expected = record.get("expected", {})
+        errors = validate_response(expected, output or {})
+
+        result = {
+            "task_id": task_id,
+            "status": findings["overall_status"],
+            "output": output,
+            "errors": errors,
+            "cached_turns": agent.cache_hits,
+            "eval_findings": findings
+        }
+        return result, findings
+
+    except Exception as e:
+        logger.error(f"Error executing task {task_id}: {e}")
+        result = {
+            "task_id": task_id,
+            "status": "error",
+            "output": None,
+            "errors": [str(e)],
+            "eval_findings": None
+        }
+        return result, None
+
+    finally:
+        agents.put(agent)
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Run the agent over evals.jsonl")
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Reuse LLM turns cached in output/cache from earlier runs (skips the latency check for replayed tasks)",
+    )
+    args = parser.parse_args()
+    cache_dir = Path("output") / "cache" if args.cache else None
+
     print("\n" + "=" * 60)
     print("🤖 STARTING AUTONOMOUS AGENT RUN (Orchestrator Mode)")
     print("=" * 60)
@@ -30,87 +122,70 @@ def main():
         print("Error: evals.jsonl not found.")
         return
 
-    records = []
-    with open(evals_path, "r", encoding="utf-8") as f:
-        for line in f:
-            if line.strip():
-                records.append(json.loads(line))
+    # Records are parsed lazily as they are submitted; only the count is needed up front
+    total = count_jsonl(evals_path)
+    print(f"📂 Found {total} eval records\n")
 
-    print(f"📂 Loaded {len(records)} eval records\n")
+    # Tasks are dominated by OpenAI round-trips, so run several at once
+    concurrency = max(1, min(int(os.getenv("EDD_CONCURRENCY", "8")), total))
+    # OpenAI calls from all workers share one requests-per-minute budget
+    rate_limiter = RateLimiter(int(os.getenv("EDD_OPENAI_RPM", "500")))
+    agents = queue.Queue()
+    for _ in range(concurrency):
+        agents.put(AutonomousAgent(cache_dir=cache_dir, rate_limiter=rate_limiter))
 
-    agent = AutonomousAgent()
     eval_runner = EvalRunner()
-    results = []
-    eval_findings = []
+    results = [None] * total
+    findings_by_idx = [None] * total
     passed_count = 0
 
-    for idx, record in enumerate(records, 1):
-        task_id = record.get("task_id", "unknown")
-        print(f"🔹 Processing Task {idx}/{len(records)}: {task_id}")
-
-        try:
-            # Throttling
-            time.sleep(1)
-
-            # Execute agent
-            start_time = time.time()
-            output = agent.run_with_retries(record)
-            end_time = time.time()
-            
-            # Calculate metrics
-            latency_ms = (end_time - start_time) * 1000
-            
-            # Get token stats from tracer if available
-            metrics = {
-                "latency_ms": latency_ms,
-                "personalization_score": 0,  # Will be calculated by eval_runner
-                "locale_accuracy": 0,  # Will be calculated by eval_runner
-                "safety_violations": 0
-            }
-
-            # Run comprehensive evaluation
-            findings = eval_runner.run_eval(record, output or {}, metrics)
-            eval_findings.append(findings)
-            
-            # Legacy validation for backward compatibility
-            expected = record.get("expected", {})
-            errors = validate_response(expected, output or {})
-
-            status = findings["overall_status"]
-            if status in ["passed", "passed_with_warnings"]:
-                passed_count += 1
-
-            results.append(
-                {
-                    "task_id": task_id,
-                    "status": status,
-                    "output": output,
-                    "errors": errors,
-                    "eval_findings": findings
-                }
-            )
-
-        except Exception as e:
-            logger.error(f"Error executing task {task_id}: {e}")
-            results.append(
-                {
-                    "task_id": task_id,
-                    "status": "error",
-                    "output": None,
-                    "errors": [str(e)],
-                    "eval_findings": None
-                }
-            )
+    # Submit one record per free worker so only `concurrency` parsed records are in flight
+    records = _iter_records(evals_path)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = {}
+        while True:
+            while len(pending) < concurrency:
+                item = next(records, None)
+                if item is None:
+                    break
+                idx, record, error = item
+                if error is not None:
+                    logger.error(error)
+                    results[idx - 1] = {
+                        "task_id": "unknown",
+                        "status": "error",
+                        "output": None,
+                        "errors": [error],
+                        "eval_findings": None
+                    }
+                    continue
+                future = executor.submit(_run_one, agents, eval_runner, record, idx, total)
+                pending[future] = idx - 1
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pos = pending.pop(future)
+                result, findings = future.result()
+                results[pos] = result
+                findings_by_idx[pos] = findings
+                if result["status"] in ["passed", "passed_with_warnings"]:
+                    passed_count += 1
+
+    # Trace reports are rebuilt on a timer while tasks run; write the final one now
+    agents.get().tracer.flush()
+
+    # Keep findings in eval-file order, skipping tasks that errored
+    eval_findings = [f for f in findings_by_idx if f is not None]
 
     print("\n" + "=" * 60)
-    print(f"📊 FINAL RESULTS: {passed_count}/{len(records)} Passed")
+    print(f"📊 FINAL RESULTS: {passed_count}/{total} Passed")
     print("=" * 60)
 
     # Save Results
     output_dir = Path("output")
     output_dir.mkdir(exist_ok=True)
-    with open(output_dir / "results_orchestrator.json", "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+    (output_dir / "results_orchestrator.json").write_bytes(dumps_bytes(results, indent=True))
 
     # Save detailed evaluation report
     report_text = eval_runner.generate_report(eval_findings)
@@ -118,8 +193,7 @@ def main():
         f.write(report_text)
     
     # Save structured eval findings
-    with open(output_dir / "eval_findings.json", "w", encoding="utf-8") as f:
-        json.dump(eval_findings, f, indent=2, ensure_ascii=False)
+    (output_dir / "eval_findings.json").write_bytes(dumps_bytes(eval_findings, indent=True))
 
     print("✅ Results saved to output/results_orchestrator.json")
     print("📋 Detailed evaluation report saved to output/eval_report.txt")
@@ -8,10 +8,10 @@ Usage:
     python run_eval_only.py --results output/results_orchestrator.json
 """
 
-import json
 import argparse
 from pathlib import Path
 from eval_runner import EvalRunner
+from src.jsonio import dumps_bytes, iter_jsonl, loads
 
 
 def main():
@@ -31,6 +31,12 @@ def main():
         default="output",
         help="Directory to save evaluation reports",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes for evaluation (default: CPU count)",
+    )
     args = parser.parse_args()
 
     # Load evaluation records
@@ -39,12 +45,7 @@ def main():
         print(f"❌ Error: {args.evals} not found.")
         return
 
-    eval_records = {}
-    with open(evals_path, "r", encoding="utf-8") as f:
-        for line in f:
-            if line.strip():
-                record = json.loads(line)
-                eval_records[record["task_id"]] = record
+    eval_records = {record["task_id"]: record for record in iter_jsonl(evals_path)}
 
     # Load agent results
     results_path = Path(args.results)
@@ -52,8 +53,8 @@ def main():
         print(f"❌ Error: {args.results} not found.")
         return
 
-    with open(results_path, "r", encoding="utf-8") as f:
-        results = json.load(f)
+    with open(results_path, "rb") as f:
+        results = loads(f.read())
 
     print("\n" + "=" * 60)
     print("🔍 RUNNING EVALUATION ON EXISTING RESULTS")
@@ -62,9 +63,8 @@ def main():
     print(f"📊 Results found: {len(results)}")
     print()
 
-    # Run evaluation
-    eval_runner = EvalRunner()
-    eval_findings = []
+    # Collect the tasks to evaluate
+    eval_items = []
 
     for result in results:
         task_id = result["task_id"]
@@ -84,9 +84,14 @@ def main():
             "safety_violations": 0,
         }
 
-        # Run comprehensive evaluation
-        findings = eval_runner.run_eval(eval_record, output or {}, metrics)
-        eval_findings.append(findings)
+        eval_items.append((eval_record, output or {}, metrics))
+
+    # Run comprehensive evaluation across worker processes
+    eval_runner = EvalRunner()
+    eval_findings = EvalRunner.run_evals_parallel(eval_items, max_workers=args.workers)
+
+    for findings in eval_findings:
+        task_id = findings["task_id"]
 
         # Print quick status
         status_emoji = (
@@ -106,8 +111,7 @@ def main():
     with open(output_dir / "eval_report.txt", "w", encoding="utf-8") as f:
         f.write(report_text)
 
-    with open(output_dir / "eval_findings.json", "w", encoding="utf-8") as f:
-        json.dump(eval_findings, f, indent=2, ensure_ascii=False)
+    (output_dir / "eval_findings.json").write_bytes(dumps_bytes(eval_findings, indent=True))
 
     # Print summary
     passed = sum(1 for f in eval_findings if f["overall_status"] == "passed")
@@ -1,38 +1,152 @@
+import hashlib
 import json
 import logging
 import time
 import random
 import os
-import tiktoken
-from typing import Dict, Any, List, Optional
-from langchain_openai import ChatOpenAI
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Any, List, Optional
 from langchain_core.messages import (
     BaseMessage,
     SystemMessage,
     HumanMessage,
     ToolMessage,
     AIMessage,
+    message_to_dict,
+    messages_from_dict,
 )
 from .tools import verify_channel_consent, check_compliance_rules, get_current_time
-from .validation import validate_response
+from .validation import make_validator
+from .jsonio import dumps, loads
+from .ratelimit import RateLimiter
 from .tracing import TraceLogger
 
 # Configure logger
 logger = logging.getLogger(__name__)
 
+# Tool calls requested in the same turn are independent, so they run concurrently.
+# The pool is shared by every agent in the process.
+_TOOL_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="edd-tool")
+_TOOL_TIMEOUT_S = 10
+
+
+# "1s", "6m0s", "20ms" as used by x-ratelimit-reset-requests
+_DURATION_PART_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+# "Please try again in 20s." / "Please retry after 3 seconds"
+_RETRY_MESSAGE_RE = re.compile(
+    r"(?:try again in|retry after)\s+(\d+(?:\.\d+)?)\s*(ms|s|sec|seconds?)\b", re.IGNORECASE
+)
+
+
+# Tools whose output changes from run to run. Their results enter the LLM cache
+# key with the time of day blanked out, so same-day reruns still hit the cache.
+_VOLATILE_TOOLS = frozenset({get_current_time.name})
+_TIME_OF_DAY_RE = re.compile(r"T\d{2}:\d{2}:\d{2}(?:\.\d+)?")
+
+
+# First ```json block, up to its closing fence (or the end if the fence was never closed)
+_JSON_FENCE_RE = re.compile(r"```json(.*?)(?:```|\Z)", re.DOTALL)
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    parts = _DURATION_PART_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(num) * _DURATION_UNITS[unit] for num, unit in parts)
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Returns the server-requested wait for a rate-limit error, if it gave one."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    value = headers.get("x-ratelimit-reset-requests")
+    if value:
+        seconds = _parse_duration(value)
+        if seconds is not None:
+            return seconds
+
+    match = _RETRY_MESSAGE_RE.search(str(error))
+    if match:
+        num, unit = match.groups()
+        return float(num) * (0.001 if unit.lower() == "ms" else 1)
+    return None
+
+
+def _timed_invoke(tool_func, args):
+    """Invokes a tool and returns (result, latency in seconds)."""
+    start = time.time()
+    result = tool_func.invoke(args)
+    return result, time.time() - start
+
 
 class AutonomousAgent:
-    def __init__(self):
+    MODEL = "gpt-4o"
+    TEMPERATURE = 0
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
         if not os.getenv("OPENAI_API_KEY"):
             raise ValueError("OPENAI_API_KEY is required.")
 
-        self.llm = ChatOpenAI(model="gpt-4o", temperature=0)
+        # Imported here so modules that only need the helpers above don't pay
+        # for the LangChain/OpenAI and tokenizer import chains
+        import tiktoken
+        from langchain_openai import ChatOpenAI
+
+        self.llm = ChatOpenAI(model=self.MODEL, temperature=self.TEMPERATURE)
         self.tools = [verify_channel_consent, check_compliance_rules, get_current_time]
         self.tool_map = {t.name: t for t in self.tools}
         self.llm_with_tools = self.llm.bind_tools(self.tools)
+        self.rate_limiter = rate_limiter
+        # Tool definitions are fixed for the agent's lifetime, so their schemas
+        # are built once for both the cache key and token accounting
+        tools_schema = [t.args_schema.schema() if t.args_schema else {} for t in self.tools]
+
+        # Optionally, LLM turns are cached on disk, keyed by everything that
+        # determines the response, so reruns with unchanged inputs skip the
+        # OpenAI call. cache_hits counts the turns replayed for the current task.
+        self.cache_dir = cache_dir
+        self.cache_hits = 0
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._tools_schema_json = json.dumps(tools_schema, sort_keys=True)
 
         self.tracer = TraceLogger()
         self.encoder = tiktoken.encoding_for_model("gpt-4o")
+        # The system prompt, tool schemas and earlier messages are re-counted on
+        # every step and retry; identical text only needs encoding once.
+        self._count_tokens = lru_cache(maxsize=4096)(
+            lambda text: len(self.encoder.encode(text))
+        )
+        # Tool definition cost is estimated by schema size
+        self._tools_schema_tokens = self._count_tokens(json.dumps(tools_schema))
 
         self.system_prompt = """You are an Autonomous Messaging Orchestrator for a Property Management System.
 
@@ -90,9 +204,12 @@ You must output a single valid JSON block at the very end of your conversation m
 
         # Start Trace
         self.tracer.start_trace(task_id, input_data=eval_record)
+        self.cache_hits = 0
 
         last_error = None
         last_output = None
+        # Specialized once per task and shared by every attempt and repair turn
+        validator = make_validator(eval_record.get("expected", {}))
 
         for attempt in range(1, max_retries + 1):
             logger.info(f"--- Attempt {attempt}/{max_retries} for Task {task_id} ---")
@@ -103,7 +220,7 @@ You must output a single valid JSON block at the very end of your conversation m
             try:
                 # 1. Execute ReAct Loop
                 output = self._execute_react_loop(
-                    eval_record, attempt_context=last_error
+                    eval_record, validator, attempt_context=last_error
                 )
                 last_output = output
 
@@ -112,8 +229,7 @@ You must output a single valid JSON block at the very end of your conversation m
                     raise ValueError(msg)
 
                 # 2. Validate
-                expected = eval_record.get("expected", {})
-                validation_errors = validate_response(expected, output)
+                validation_errors = validator(output)
 
                 if not validation_errors:
                     logger.info(f"   ✅ Attempt {attempt} Succeeded!")
@@ -138,29 +254,40 @@ You must output a single valid JSON block at the very end of your conversation m
         return last_output
 
     def _execute_react_loop(
-        self, eval_record: Dict[str, Any], attempt_context: str = None
+        self,
+        eval_record: Dict[str, Any],
+        validator: Callable[[Dict], List[str]],
+        attempt_context: str = None,
     ) -> Optional[Dict]:
         """Core ReAct loop"""
         messages: List[BaseMessage] = [SystemMessage(content=self.system_prompt)]
 
         user_content = (
-            f"Please process this Task Record:\n{json.dumps(eval_record, indent=2)}"
+            f"Please process this Task Record:\n{dumps(eval_record, indent=True)}"
         )
         if attempt_context:
             user_content += f"\n\n🚨 PREVIOUS ATTEMPT FAILED. Errors:\n{attempt_context}\n\nPlease fix these issues in this new attempt."
 
         messages.append(HumanMessage(content=user_content))
 
+        # Token counts are accumulated as messages are appended rather than re-walked each step
+        breakdown = self._new_breakdown()
+        counted = 0
+
+        last_blob = None
+
         max_steps = 10
         for step in range(max_steps):
 
             step_start_time = time.time()
 
             # --- TOKEN COUNTING (Pre-Call) ---
-            breakdown, total_prompt_tokens = self._calculate_context_tokens(messages)
+            self._add_message_tokens(breakdown, messages[counted:])
+            counted = len(messages)
+            total_prompt_tokens = sum(breakdown.values())
 
             # Invoke LLM
-            response = self._invoke_with_backoff(self.llm_with_tools, messages)
+            response = self._invoke_cached(messages)
             messages.append(response)
 
             llm_end_time = time.time()
@@ -177,7 +304,7 @@ You must output a single valid JSON block at the very end of your conversation m
                 "completion_tokens": completion_tokens,
                 "total_tokens": prompt_tokens + completion_tokens,
                 "total_context": prompt_tokens,  # Synonymous here
-                "breakdown": breakdown,
+                "breakdown": dict(breakdown),  # snapshot; the running totals keep growing
             }
 
             executed_tools = []
@@ -188,17 +315,27 @@ You must output a single valid JSON block at the very end of your conversation m
                     f"   Step {step+1}: Agent requested tools: {[tc['name'] for tc in response.tool_calls]}"
                 )
 
+                # Dispatch every call first, then collect results in request order
+                pending = []
                 for tool_call in response.tool_calls:
-                    tool_start = time.time()
-                    tool_result = "Error: Tool not found"
-                    try:
-                        tool_func = self.tool_map.get(tool_call["name"])
-                        if tool_func:
-                            tool_result = tool_func.invoke(tool_call["args"])
-                    except Exception as e:
-                        tool_result = f"Error: {str(e)}"
+                    tool_func = self.tool_map.get(tool_call["name"])
+                    future = None
+                    if tool_func:
+                        future = _TOOL_POOL.submit(_timed_invoke, tool_func, tool_call["args"])
+                    pending.append((tool_call, future, time.time()))
 
-                    tool_latency = time.time() - tool_start
+                for tool_call, future, tool_start in pending:
+                    tool_result = "Error: Tool not found"
+                    tool_latency = 0.0
+                    if future is not None:
+                        try:
+                            tool_result, tool_latency = future.result(timeout=_TOOL_TIMEOUT_S)
+                        except FutureTimeoutError:
+                            tool_result = f"Error: Tool timed out after {_TOOL_TIMEOUT_S}s"
+                            tool_latency = time.time() - tool_start
+                        except Exception as e:
+                            tool_result = f"Error: {str(e)}"
+                            tool_latency = time.time() - tool_start
 
                     # Add to executed list
                     executed_tools.append(
@@ -233,31 +370,110 @@ You must output a single valid JSON block at the very end of your conversation m
 
             # Check for JSON in response (Final Answer)
             content = response.content or ""
-            if "```json" in content:
+            fence = _JSON_FENCE_RE.search(content)
+            if fence:
                 try:
-                    json_str = content.split("```json")[1].split("```")[0].strip()
-                    blob = json.loads(json_str)
-                    return blob
+                    blob = loads(fence.group(1).strip())
                 except Exception as e:
                     logger.warning(f"Agent produced malformed JSON: {e}")
                     messages.append(HumanMessage(content=f"Invalid JSON: {e}"))
+                    continue
+
+                # Ask for a targeted fix in the same conversation instead of
+                # discarding the context and starting a fresh attempt
+                validation_errors = validator(blob)
+                if not validation_errors:
+                    return blob
+                last_blob = blob
+                logger.warning(
+                    f"   Step {step+1}: Answer failed validation: {'; '.join(validation_errors)}"
+                )
+                messages.append(
+                    HumanMessage(
+                        content=f"Validation Failed: {'; '.join(validation_errors)}\n\n"
+                        "Please fix these issues and output a corrected FINAL JSON block."
+                    )
+                )
             elif step == max_steps - 1:
                 logger.error("Max steps reached without output.")
 
-        return None
+        # Out of steps: hand back the last answer so the caller can report or retry it
+        return last_blob
+
+    def _cache_key(self, messages: List[BaseMessage]) -> str:
+        """Hashes the model settings, tool schemas and conversation so far."""
+        h = hashlib.sha256()
+        h.update(f"{self.MODEL}|{self.TEMPERATURE}|".encode())
+        h.update(self._tools_schema_json.encode())
+        volatile_ids = set()
+        for msg in messages:
+            tool_calls = getattr(msg, "tool_calls", None)
+            content = msg.content
+            if tool_calls:
+                volatile_ids.update(
+                    tc["id"] for tc in tool_calls if tc["name"] in _VOLATILE_TOOLS
+                )
+            elif getattr(msg, "tool_call_id", None) in volatile_ids:
+                content = _TIME_OF_DAY_RE.sub("T", str(content))
+            h.update(f"\x00{msg.type}\x00{content}\x00{tool_calls}".encode())
+        return h.hexdigest()
+
+    def _invoke_cached(self, messages: List[BaseMessage]) -> AIMessage:
+        """Returns the cached response for this conversation, calling the LLM on a miss."""
+        if self.cache_dir is None:
+            return self._invoke_with_backoff(self.llm_with_tools, messages)
+
+        cache_path = self.cache_dir / f"{self._cache_key(messages)}.json"
+        try:
+            with open(cache_path, "rb") as f:
+                response = messages_from_dict([loads(f.read())])[0]
+            self.cache_hits += 1
+            return response
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable LLM cache entry {cache_path.name}: {e}")
+
+        response = self._invoke_with_backoff(self.llm_with_tools, messages)
+
+        # Write to a per-thread temp file first so concurrent agents never see a partial entry
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(dumps(message_to_dict(response)))
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            # The response is already paid for; losing its cache entry is not fatal
+            logger.warning(f"Could not write LLM cache entry {cache_path.name}: {e}")
+            try:
+                tmp_path.unlink(missing_ok=True)
+            except OSError:
+                pass
+        return response
 
     def _invoke_with_backoff(self, runnable, input_data, max_retries=5):
-        """Exponential backoff helper"""
+        """Retries rate-limited calls, waiting as long as the server asks or backing off exponentially"""
         delay = 1
         for attempt in range(max_retries):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
             try:
                 return runnable.invoke(input_data)
             except Exception as e:
                 error_str = str(e)
-                if "429" in error_str or "rate_limit" in error_str.lower():
+                if (
+                    getattr(e, "status_code", None) == 429
+                    or "429" in error_str
+                    or "rate_limit" in error_str.lower()
+                ):
                     if attempt == max_retries - 1:
                         raise e
-                    sleep_time = delay + random.uniform(0, 1)
+                    retry_after = _retry_after_seconds(e)
+                    if retry_after is not None:
+                        # Small jitter so concurrent workers don't all retry at once
+                        sleep_time = retry_after + random.uniform(0, 0.25)
+                    else:
+                        sleep_time = delay + random.uniform(0, 1)
                     logger.warning(
                         f"⚠️ Rate limit hit. Retrying in {sleep_time:.2f}s..."
                     )
@@ -266,28 +482,24 @@ You must output a single valid JSON block at the very end of your conversation m
                 else:
                     raise e
 
-    def _calculate_context_tokens(self, messages: List[BaseMessage]):
-        """Calculates token value for each message type in context."""
-        breakdown = {
+    def _new_breakdown(self) -> Dict[str, int]:
+        """Returns an empty per-type token breakdown with the tool schemas pre-counted."""
+        return {
             "system": 0,
-            "tools": 0,
+            "tools": self._tools_schema_tokens,
             "human": 0,
             "ai": 0,
             "tool_call": 0,
             "tool_output": 0,
         }
 
-        # 1. Tools Def (Estimating schema size)
-        tools_schema = [
-            t.args_schema.schema() if t.args_schema else {} for t in self.tools
-        ]
-        tools_str = json.dumps(tools_schema)
-        breakdown["tools"] = len(self.encoder.encode(tools_str))
-
-        # 2. Messages
-        for msg in messages:
+    def _add_message_tokens(
+        self, breakdown: Dict[str, int], new_messages: List[BaseMessage]
+    ) -> None:
+        """Adds the token value of newly appended messages to the breakdown."""
+        for msg in new_messages:
             content_str = str(msg.content)
-            count = len(self.encoder.encode(content_str))
+            count = self._count_tokens(content_str)
 
             if isinstance(msg, SystemMessage):
                 breakdown["system"] += count
@@ -297,11 +509,7 @@ You must output a single valid JSON block at the very end of your conversation m
                 breakdown["ai"] += count
                 if msg.tool_calls:
                     for tc in msg.tool_calls:
-                        tc_str = json.dumps(tc)
-                        breakdown["tool_call"] += len(self.encoder.encode(tc_str))
+                        breakdown["tool_call"] += self._count_tokens(dumps(tc))
 
             elif isinstance(msg, ToolMessage):
                 breakdown["tool_output"] += count
-
-        total = sum(breakdown.values())
-        return breakdown, total
@@ -0,0 +1,57 @@
+import json
+from typing import Any, Callable, Iterator, Optional, Union
+
+# orjson is optional; fall back to the stdlib parser when it is not installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Parses a JSON document from str or bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(
+    obj: Any, indent: bool = False, default: Optional[Callable[[Any], Any]] = None
+) -> str:
+    """Serializes obj to a str, keeping non-ASCII characters as-is.
+
+    `default` converts objects JSON can't represent, as in json.dumps.
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            obj, default=default, option=orjson.OPT_INDENT_2 if indent else 0
+        ).decode()
+    # Match orjson's output: compact separators unless indenting
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False, default=default)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=default)
+
+
+def dumps_bytes(
+    obj: Any, indent: bool = False, default: Optional[Callable[[Any], Any]] = None
+) -> bytes:
+    """Serializes obj to UTF-8 bytes, ready for a single binary write."""
+    if orjson is not None:
+        return orjson.dumps(
+            obj, default=default, option=orjson.OPT_INDENT_2 if indent else 0
+        )
+    return dumps(obj, indent=indent, default=default).encode("utf-8")
+
+
+def iter_jsonl(path) -> Iterator[Any]:
+    """Yields one parsed record per non-blank line of a JSONL file."""
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+
+def count_jsonl(path) -> int:
+    """Counts the non-blank lines of a JSONL file without parsing them."""
+    with open(path, "rb") as f:
+        return sum(1 for line in f if line.strip())
@@ -0,0 +1,32 @@
+import threading
+import time
+from collections import deque
+
+
+class RateLimiter:
+    """Sliding-window limiter allowing at most `rate` requests per `period` seconds.
+
+    Shared by every agent in the process so concurrent workers stay under the
+    account's requests-per-minute limit together.
+    """
+
+    def __init__(self, rate: int, period: float = 60.0):
+        if rate < 1:
+            raise ValueError("rate must be at least 1")
+        self.rate = rate
+        self.period = period
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Blocks until a request slot is free, then claims it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self.period:
+                    self._calls.popleft()
+                if len(self._calls) < self.rate:
+                    self._calls.append(now)
+                    return
+                wait = self.period - (now - self._calls[0])
+            time.sleep(wait)
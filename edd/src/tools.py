@@ -1,18 +1,22 @@
 import json
 from datetime import datetime
-from zoneinfo import ZoneInfo
+from functools import lru_cache
 from langchain_core.tools import tool
 
+# Fair Housing terms, in the order violations are reported
+_DISCRIMINATORY_TERMS = (
+    "adults only",
+    "no children",
+    "christian",
+    "white",
+    "bachelor",
+)
 
-@tool
-def verify_channel_consent(channel: str, consent_record: str) -> str:
-    """
-    Verifies if a specific channel has opt-in consent based on the record.
 
-    Args:
-        channel: 'email', 'sms', or 'voice'
-        consent_record: JSON string of the consent object e.g. '{"email_opt_in": true...}'
-    """
+# The consent and compliance checks are pure functions of their (string) inputs,
+# and the agent often repeats identical calls across steps and retries.
+@lru_cache(maxsize=512)
+def _verify_impl(channel: str, consent_record: str) -> str:
     try:
         data = json.loads(consent_record)
         key_map = {
@@ -31,11 +35,8 @@ def verify_channel_consent(channel: str, consent_record: str) -> str:
         return f"Error verifying consent: {str(e)}"
 
 
-@tool
-def check_compliance_rules(message_body: str, channel: str) -> str:
-    """
-    Checks message content for regulatory compliance (Fair Housing, Opt-out).
-    """
+@lru_cache(maxsize=512)
+def _compliance_impl(message_body: str, channel: str) -> str:
     issues = []
     body_lower = message_body.lower()
 
@@ -52,14 +53,7 @@ def check_compliance_rules(message_body: str, channel: str) -> str:
             issues.append("Email must include unsubscribe/opt-out instructions")
 
     # Check 2: Fair Housing (Basic keyword check)
-    discriminatory_terms = [
-        "adults only",
-        "no children",
-        "christian",
-        "white",
-        "bachelor",
-    ]
-    for term in discriminatory_terms:
+    for term in _DISCRIMINATORY_TERMS:
         if term in body_lower:
             issues.append(f"Potential Fair Housing violation found: '{term}'")
 
@@ -69,11 +63,40 @@ def check_compliance_rules(message_body: str, channel: str) -> str:
         return f"Compliance Check: FAILED. Issues: {'; '.join(issues)}"
 
 
+# ZoneInfo keeps its own weak cache, but instances can be evicted between calls;
+# holding strong references pins the parsed tzdata for every zone the agent uses.
+@lru_cache(maxsize=64)
+def _zone(timezone: str):
+    from zoneinfo import ZoneInfo
+
+    return ZoneInfo(timezone)
+
+
+@tool
+def verify_channel_consent(channel: str, consent_record: str) -> str:
+    """
+    Verifies if a specific channel has opt-in consent based on the record.
+
+    Args:
+        channel: 'email', 'sms', or 'voice'
+        consent_record: JSON string of the consent object e.g. '{"email_opt_in": true...}'
+    """
+    return _verify_impl(channel, consent_record)
+
+
+@tool
+def check_compliance_rules(message_body: str, channel: str) -> str:
+    """
+    Checks message content for regulatory compliance (Fair Housing, Opt-out).
+    """
+    return _compliance_impl(message_body, channel)
+
+
 @tool
 def get_current_time(timezone: str) -> str:
     """Returns the current time in the specified timezone."""
     try:
-        tz = ZoneInfo(timezone)
+        tz = _zone(timezone)
         now = datetime.now(tz)
         return now.isoformat()
     except Exception as e:
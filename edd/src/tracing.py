@@ -1,71 +1,174 @@
-import json
+import logging
+import os
+import reprlib
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 
+from .jsonio import dumps, dumps_bytes, loads
 
-class TraceLogger:
-    def __init__(self, log_dir="output/logs"):
-        self.log_dir = Path(log_dir)
-        self.log_dir.mkdir(parents=True, exist_ok=True)
-        self.current_trace = []
+# markupsafe's C escaper is fastest on mostly-clean text; html.escape is the fallback
+try:
+    from markupsafe import escape as _markup_escape
 
-    def start_trace(self, task_id: str, input_data: Dict[str, Any] = None):
-        self.current_trace = {
-            "task_id": task_id,
-            "start_time": datetime.now().isoformat(),
-            "input_data": input_data,
-            "steps": [],
-            "token_stats": [],
-        }
+    def _escape(value: Any) -> str:
+        return str(_markup_escape(value))
 
-    def log_turn(self, turn_data: Dict[str, Any]):
-        """
-        Logs a full turn of execution.
-        turn_data structure:
-        {
-            "turn_id": 1,
-            "latency_ms": 1200,
-            "ai_content": "...",
-            "tool_calls": [
-                {"name": "...", "args": {...}, "output": "...", "latency_ms": 300}
-            ],
-            "token_stats": { ... }
-        }
-        """
-        self.current_trace["steps"].append(
-            {
-                "type": "turn",
-                "timestamp": datetime.now().isoformat(),
-                "content": turn_data,
-            }
-        )
+except ImportError:
+    import html
 
-    def save_trace(self):
-        if not self.current_trace:
-            return
+    def _escape(value: Any) -> str:
+        return html.escape(str(value))
 
-        task_id = self.current_trace["task_id"]
-        filename = self.log_dir / f"trace_{task_id}.json"
+# msgpack is optional; traces are stored as JSON when it is not installed
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(self.current_trace, f, indent=2, default=str)
+# zstandard is optional; trace files are left uncompressed without it
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
-        self.generate_html_report()
+logger = logging.getLogger(__name__)
 
-    def generate_html_report(self):
-        """Generates a consolidated HTML report of all traces."""
-        traces = []
-        for f in self.log_dir.glob("trace_*.json"):
-            try:
-                traces.append(json.loads(f.read_text(encoding="utf-8")))
-            except:
-                continue
+# Agents on worker threads share the log directory and the consolidated report
+_REPORT_LOCK = threading.Lock()
+# Minimum seconds between HTML report rebuilds triggered by save_trace
+_REPORT_INTERVAL_S = 2.0
+# Step payloads larger than this (UTF-8 bytes) go to a sidecar file instead of
+# the trace itself; the trace keeps a {"$blob": [offset, length]} reference.
+# Plain JSON traces are meant to be read by people, so they keep payloads inline.
+_BLOB_MIN_BYTES = 4096
+# Traces are only read back by this module, so they are stored as msgpack and
+# zstd-compressed when those are available. EDD_TRACE_JSON=1 keeps plain,
+# human-readable JSON for debugging.
+if os.getenv("EDD_TRACE_JSON") == "1":
+    _TRACE_SUFFIX = ".json"
+else:
+    _TRACE_SUFFIX = (".msgpack" if msgpack is not None else ".json") + (
+        ".zst" if zstandard is not None else ""
+    )
+_TRACE_SUFFIXES = (".json", ".msgpack", ".json.zst", ".msgpack.zst")
+# Errors that mean a trace file is unreadable or malformed. Decoders raise
+# ValueError subclasses (zstandard has its own error type); KeyError and
+# TypeError come from traces missing expected fields.
+_TRACE_READ_ERRORS = (OSError, ValueError, KeyError, TypeError) + (
+    (zstandard.ZstdError,) if zstandard is not None else ()
+)
 
-        # Sort by start time newest first
-        traces.sort(key=lambda x: x["start_time"], reverse=True)
 
-        html = """
+def _write_bytes(path, data: bytes) -> None:
+    """Atomically replaces path with data, written with raw os.write calls.
+
+    Readers see either the old file or the complete new one, never a partial write.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, path)
+
+
+def _read_bytes(path, size: int) -> bytes:
+    """Reads a whole file with raw os.read calls, expecting about `size` bytes.
+
+    Asking for one byte more than the stat'ed size lets a single short read mark
+    EOF; the loop only runs again if the file grew since it was stat'ed.
+    """
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_NOCTTY", 0))
+    try:
+        want = size + 1
+        chunks = [os.read(fd, want)]
+        while len(chunks[-1]) == want:
+            chunks.append(os.read(fd, want))
+    finally:
+        os.close(fd)
+    return chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+
+def _encode_trace(trace: Dict[str, Any], suffix: str) -> bytes:
+    compress = suffix.endswith(".zst")
+    if compress:
+        suffix = suffix[: -len(".zst")]
+    if suffix == ".msgpack":
+        data = msgpack.packb(trace, default=str, use_bin_type=True)
+    else:
+        # Compressed JSON isn't read by people, so skip the indentation
+        data = dumps_bytes(trace, indent=not compress, default=str)
+    if compress:
+        data = zstandard.ZstdCompressor(level=3).compress(data)
+    return data
+
+
+def _decode_trace(data: bytes, name: str) -> Dict[str, Any]:
+    if name.endswith(".zst"):
+        if zstandard is None:
+            raise ValueError("zstandard is not installed")
+        data = zstandard.ZstdDecompressor().decompress(data)
+        name = name[: -len(".zst")]
+    if name.endswith(".msgpack"):
+        if msgpack is None:
+            raise ValueError("msgpack is not installed")
+        return msgpack.unpackb(data, raw=False)
+    return loads(data)
+
+
+def _trace_start_ns(trace: Dict[str, Any]) -> int:
+    """Returns a trace's start time in ns, parsing the ISO start_time of older traces."""
+    if "start_ns" in trace:
+        return trace["start_ns"]
+    return int(datetime.fromisoformat(trace["start_time"]).timestamp() * 1e9)
+
+
+def _load_blob(blob_path: str, ref: Dict[str, Any], max_bytes: int = None) -> str:
+    """Reads a payload moved to a trace's sidecar file, optionally only its first max_bytes."""
+    offset, length = ref["$blob"]
+    if max_bytes is not None:
+        length = min(length, max_bytes)
+    try:
+        with open(blob_path, "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+    except OSError:
+        return "[payload unavailable: missing trace sidecar]"
+    # A partial read may end mid-character
+    return data.decode("utf-8", errors="ignore")
+
+
+def _is_blob_ref(value: Any) -> bool:
+    return isinstance(value, dict) and "$blob" in value
+
+
+# Tool results are shown up to this many characters
+_RESULT_PREVIEW_CHARS = 300
+
+# Bounded repr for non-string tool outputs, so a huge dict or list is never
+# fully stringified just to show its first few hundred characters
+_preview_repr = reprlib.Repr()
+_preview_repr.maxstring = _RESULT_PREVIEW_CHARS
+_preview_repr.maxother = _RESULT_PREVIEW_CHARS
+_preview_repr.maxlevel = 3
+
+
+def _preview(value: Any, limit: int = _RESULT_PREVIEW_CHARS) -> str:
+    """Returns at most `limit` characters of value, marking truncation with an ellipsis."""
+    text = value if isinstance(value, str) else _preview_repr.repr(value)
+    if len(text) > limit:
+        return text[:limit] + "…"
+    return text
+
+
+# Page head and styles of the consolidated trace report
+_HTML_HEAD = """
         <!DOCTYPE html>
         <html>
         <head>
@@ -131,125 +234,332 @@ class TraceLogger:
             <h1>🤖 Agent Execution Traces</h1>
         """
 
-        for t in traces:
-            start_iso = t["start_time"]
-            total_latency_str = "?"
+# Token breakdown segment colors, matching the .bg-* classes in the page styles
+_TOKEN_COLORS = {
+    "system": "#607D8B",
+    "tools": "#795548",
+    "human": "#9C27B0",
+    "ai": "#2196F3",
+    "tool_output": "#4CAF50",
+    "tool_call": "#FF9800",
+}
+
+# Per-trace fragments of the HTML report, filled with str.format
+_TRACE_CARD_OPEN = """
+        <details class='trace-card' open>
+            <summary>
+                <span style="font-size: 16px;">{task_id}</span>
+                <span style="color: #666; font-size: 13px;">Total Latency: <strong>{total_latency}</strong></span>
+            </summary>
+
+            <!-- Input Data View -->
+            <details>
+                <summary style="margin: 0 15px; padding: 10px 0; font-size: 12px; color: #78909C; cursor: pointer; outline: none;">▶ View Task Input</summary>
+                <div class="input-data"><pre>{input_json}</pre></div>
+            </details>
+        """
+
+_TURN_OPEN = """
+            <div class='turn-container'>
+                <div class='turn-header'>
+                    <span class='turn-title'>Step {turn_id}: LLM Call</span>
+                    <span class='turn-latency'>⏱ {latency_s:.2f}s</span>
+                </div>
+            """
+
+_AI_CONTENT = "<div class='ai-content'>{}</div>"
+
+_TOOLS_SECTION_OPEN = """
+                <div class='tools-section'>
+                    <div class='tools-title'>Sub-steps: Tool Calls</div>
+                """
+
+_TOOL_ITEM = """
+                    <div class='tool-item'>
+                        <div class='tool-header'>
+                            <span>🛠 {name}</span>
+                            <span>{latency_s:.3f}s</span>
+                        </div>
+                        <div class='tool-body'>
+                            <div><strong>Args:</strong> {args_json}</div>
+                            <div style='margin-top:4px; border-top:1px dotted #FFCC80; padding-top:4px;'><strong>Result:</strong> {result}</div>
+                        </div>
+                    </div>
+                    """
+
+_TOKEN_BOX_OPEN = """
+                    <div class='token-box'>
+                        <div class='token-header'>
+                            <span>Context Window Utilization</span>
+                            <span><strong>{total_ctx}</strong> / 128,000 tokens ({utilization:.1f}%)</span>
+                        </div>
+                        <div class='token-bar-container'>
+                    """
+
+_TOKEN_SEG = "<div class='token-seg' style='width:{pct}%; background-color:{color}' title='{key}: {value} ({pct:.1f}%)'>{label}</div>"
+
+_LEGEND_ITEM = "<div class='legend-item'><div class='legend-box' style='background:{color}'></div>{key}: {value}</div>"
+
 
-            # Simple latency calc
+class TraceLogger:
+    # Rendered HTML per trace file, tagged with the (mtime_ns, size) it was read
+    # at and its start time in ns. Shared across instances so each report only
+    # decodes and renders trace files that changed; parsed traces are not kept.
+    _html_fragment_cache: Dict[str, Tuple[Tuple[int, int], int, str]] = {}
+    # Report throttling state, shared because every agent writes the same report
+    _report_dirty = False
+    _last_report_time = 0.0
+
+    def __init__(self, log_dir="output/logs"):
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.current_trace = []
+        self._t0 = time.monotonic_ns()
+        self._blobs: List[bytes] = []
+        self._blob_size = 0
+
+    def start_trace(self, task_id: str, input_data: Dict[str, Any] = None):
+        self._t0 = time.monotonic_ns()
+        self._blobs = []
+        self._blob_size = 0
+        self.current_trace = {
+            "task_id": task_id,
+            "start_ns": time.time_ns(),
+            "input_data": input_data,
+            "steps": [],
+            "token_stats": [],
+        }
+
+    def log_turn(self, turn_data: Dict[str, Any]):
+        """
+        Logs a full turn of execution.
+        turn_data structure:
+        {
+            "turn_id": 1,
+            "latency_ms": 1200,
+            "ai_content": "...",
+            "tool_calls": [
+                {"name": "...", "args": {...}, "output": "...", "latency_ms": 300}
+            ],
+            "token_stats": { ... }
+        }
+        Large AI content and tool outputs are stored in the trace's sidecar file,
+        unless traces are written as plain JSON.
+        """
+        content = dict(turn_data)
+        if _TRACE_SUFFIX != ".json":
+            if "ai_content" in content:
+                content["ai_content"] = self._stash(content["ai_content"])
+            if content.get("tool_calls"):
+                content["tool_calls"] = [
+                    {**tc, "output": self._stash(tc.get("output", ""))}
+                    for tc in content["tool_calls"]
+                ]
+
+        self.current_trace["steps"].append(
+            {
+                "type": "turn",
+                # Nanoseconds since start_trace
+                "ts_ns": time.monotonic_ns() - self._t0,
+                "content": content,
+            }
+        )
+
+    def _stash(self, value: Any) -> Any:
+        """Moves a large string into the sidecar buffer, returning a reference to it."""
+        if not isinstance(value, str) or len(value) <= _BLOB_MIN_BYTES // 4:
+            return value
+        data = value.encode("utf-8")
+        if len(data) <= _BLOB_MIN_BYTES:
+            return value
+        ref = {"$blob": [self._blob_size, len(data)]}
+        self._blobs.append(data)
+        self._blob_size += len(data)
+        return ref
+
+    def save_trace(self):
+        if not self.current_trace:
+            return
+
+        task_id = self.current_trace["task_id"]
+        filename = self.log_dir / f"trace_{task_id}{_TRACE_SUFFIX}"
+        blob_filename = self.log_dir / f"trace_{task_id}.blobs"
+
+        with _REPORT_LOCK:
+            # Sidecar first, so a trace on disk never references missing payloads
+            if self._blobs:
+                _write_bytes(blob_filename, b"".join(self._blobs))
+            else:
+                blob_filename.unlink(missing_ok=True)
+            _write_bytes(filename, _encode_trace(self.current_trace, _TRACE_SUFFIX))
+            # Drop a copy left in the other format so the task isn't listed twice
+            for suffix in _TRACE_SUFFIXES:
+                if suffix != _TRACE_SUFFIX:
+                    (self.log_dir / f"trace_{task_id}{suffix}").unlink(missing_ok=True)
+
+            # The trace file is always written; the report is rebuilt at most
+            # every _REPORT_INTERVAL_S and brought up to date by flush()
+            TraceLogger._report_dirty = True
+            if time.monotonic() - TraceLogger._last_report_time >= _REPORT_INTERVAL_S:
+                self._rebuild_report()
+
+    def flush(self):
+        """Regenerates the HTML report if any trace was saved since the last rebuild."""
+        with _REPORT_LOCK:
+            if TraceLogger._report_dirty:
+                self._rebuild_report()
+
+    def _rebuild_report(self):
+        # Caller holds _REPORT_LOCK
+        self.generate_html_report()
+        TraceLogger._report_dirty = False
+        TraceLogger._last_report_time = time.monotonic()
+
+    def generate_html_report(self):
+        """Generates a consolidated HTML report of all traces."""
+        cards = []
+        seen = set()
+        # scandir hands back names and stat data without building Path objects
+        with os.scandir(self.log_dir) as it:
+            entries = [
+                e for e in it if e.name.startswith("trace_") and e.name.endswith(_TRACE_SUFFIXES)
+            ]
+        for entry in entries:
+            path = entry.path
             try:
-                start_dt = datetime.fromisoformat(start_iso)
-                if t.get("steps"):
-                    last_step = t["steps"][-1]
-                    end_iso = last_step.get("timestamp", start_iso)
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            seen.add(path)
+            file_key = (st.st_mtime_ns, st.st_size)
+            cached = self._html_fragment_cache.get(path)
+            if cached is not None and cached[0] == file_key:
+                cards.append(cached[1:])
+                continue
+
+            # Trace content is only decoded when its card has to be rendered
+            try:
+                t = _decode_trace(_read_bytes(path, st.st_size), entry.name)
+                blob_path = os.path.join(self.log_dir, f"trace_{t.get('task_id')}.blobs")
+                fragment = self._render_trace_html(t, blob_path)
+                start_ns = _trace_start_ns(t)
+            except _TRACE_READ_ERRORS as e:
+                logger.warning(f"Skipping unreadable trace {entry.name}: {e}")
+                continue
+            self._html_fragment_cache[path] = (file_key, start_ns, fragment)
+            cards.append((start_ns, fragment))
+
+        # Forget traces whose files were removed
+        for path in [p for p in self._html_fragment_cache if p not in seen]:
+            del self._html_fragment_cache[path]
+
+        # Sort by start time newest first
+        cards.sort(key=lambda card: card[0], reverse=True)
+
+        parts = [_HTML_HEAD]
+        parts.extend(fragment for _, fragment in cards)
+        parts.append("</body></html>")
+        _write_bytes(self.log_dir / "trace_report.html", "".join(parts).encode("utf-8"))
+
+    @staticmethod
+    def _render_trace_html(t: Dict[str, Any], blob_path: str) -> str:
+        """Renders one trace card of the consolidated report.
+
+        Payloads stored in the sidecar at blob_path are read only while rendering.
+        """
+        parts = []
+        total_latency_str = "?"
+
+        # Simple latency calc: steps carry the time elapsed since the trace started
+        if t.get("steps"):
+            last_step = t["steps"][-1]
+            if "ts_ns" in last_step:
+                total_latency_str = f"{last_step['ts_ns'] / 1e9:.2f}s"
+            else:
+                # Traces written before "ts_ns" existed only have ISO timestamps
+                try:
+                    start_dt = datetime.fromisoformat(t["start_time"])
+                    end_iso = last_step.get("timestamp", t["start_time"])
                     end_dt = datetime.fromisoformat(end_iso)
                     total_latency = (end_dt - start_dt).total_seconds()
                     total_latency_str = f"{total_latency:.2f}s"
-            except:
-                pass
-
-            html += f"""
-            <details class='trace-card' open>
-                <summary>
-                    <span style="font-size: 16px;">{t.get('task_id', 'Unknown Task')}</span>
-                    <span style="color: #666; font-size: 13px;">Total Latency: <strong>{total_latency_str}</strong></span>
-                </summary>
-                
-                <!-- Input Data View -->
-                <details>
-                    <summary style="margin: 0 15px; padding: 10px 0; font-size: 12px; color: #78909C; cursor: pointer; outline: none;">▶ View Task Input</summary>
-                    <div class="input-data"><pre>{json.dumps(t.get('input_data', {}), indent=2)}</pre></div>
-                </details>
-            """
+                except (KeyError, TypeError, ValueError):
+                    pass
 
-            # Process "Turn" Steps
-            for step in t.get("steps", []):
-                if step["type"] != "turn":
-                    continue
-
-                data = step["content"]
-                turn_id = data.get("turn_id", "?")
-                latency_s = data.get("latency_s", 0)
-                ai_text = data.get("ai_content", "")
-                tools = data.get("tool_calls", [])
-                tokens = data.get("token_stats", {})
-
-                html += f"""
-                <div class='turn-container'>
-                    <div class='turn-header'>
-                        <span class='turn-title'>Step {turn_id}: LLM Call</span>
-                        <span class='turn-latency'>⏱ {latency_s:.2f}s</span>
-                    </div>
-                """
+        parts.append(
+            _TRACE_CARD_OPEN.format(
+                task_id=_escape(t.get("task_id", "Unknown Task")),
+                total_latency=total_latency_str,
+                input_json=_escape(dumps(t.get("input_data", {}), indent=True)),
+            )
+        )
 
-                if ai_text:
-                    html += f"<div class='ai-content'>{ai_text}</div>"
+        # Process "Turn" Steps
+        for step in t.get("steps", []):
+            if step["type"] != "turn":
+                continue
 
-                if tools:
-                    html += """
-                    <div class='tools-section'>
-                        <div class='tools-title'>Sub-steps: Tool Calls</div>
-                    """
-                    for tool in tools:
-                        t_lat = tool.get("latency_s", 0)
-                        html += f"""
-                        <div class='tool-item'>
-                            <div class='tool-header'>
-                                <span>🛠 {tool['name']}</span>
-                                <span>{t_lat:.3f}s</span>
-                            </div>
-                            <div class='tool-body'>
-                                <div><strong>Args:</strong> {json.dumps(tool.get('args', {}))}</div>
-                                <div style='margin-top:4px; border-top:1px dotted #FFCC80; padding-top:4px;'><strong>Result:</strong> {str(tool.get('output', ''))[:300]}</div>
-                            </div>
-                        </div>
-                        """
-                    html += "</div>"
-
-                # Token Viz for this turn
-                if tokens:
-                    breakdown = tokens.get("breakdown", {})
-                    total_ctx = tokens.get("total_context", 0)
-
-                    if total_ctx > 0:
-                        colors = {
-                            "system": "#607D8B",
-                            "tools": "#795548",
-                            "human": "#9C27B0",
-                            "ai": "#2196F3",
-                            "tool_output": "#4CAF50",
-                            "tool_call": "#FF9800",
-                        }
-
-                        html += f"""
-                        <div class='token-box'>
-                            <div class='token-header'>
-                                <span>Context Window Utilization</span>
-                                <span><strong>{total_ctx}</strong> / 128,000 tokens ({(total_ctx/128000*100):.1f}%)</span>
-                            </div>
-                            <div class='token-bar-container'>
-                        """
-
-                        for k, v in breakdown.items():
-                            if v > 0:
-                                pct = (v / total_ctx) * 100
-                                c = colors.get(k, "#ccc")
-                                title = f"{k}: {v} ({pct:.1f}%)"
-                                # Only show text if segment is wide enough
-                                label = str(v) if pct > 5 else ""
-                                html += f"<div class='token-seg' style='width:{pct}%; background-color:{c}' title='{title}'>{label}</div>"
-                        html += "</div>"
-
-                        # Legend
-                        html += "<div class='legend'>"
-                        for k, v in breakdown.items():
-                            if v > 0:
-                                c = colors.get(k, "#ccc")
-                                html += f"<div class='legend-item'><div class='legend-box' style='background:{c}'></div>{k}: {v}</div>"
-                        html += "</div></div>"
-
-                html += "</div>"  # Close turn-container
-
-            html += "</details>"
-
-        html += "</body></html>"
-        (self.log_dir / "trace_report.html").write_text(html, encoding="utf-8")
+            data = step["content"]
+            turn_id = data.get("turn_id", "?")
+            latency_s = data.get("latency_s", 0)
+            ai_text = data.get("ai_content", "")
+            tools = data.get("tool_calls", [])
+            tokens = data.get("token_stats", {})
+
+            parts.append(_TURN_OPEN.format(turn_id=turn_id, latency_s=latency_s))
+
+            if _is_blob_ref(ai_text):
+                ai_text = _load_blob(blob_path, ai_text)
+            if ai_text:
+                parts.append(_AI_CONTENT.format(_escape(ai_text)))
+
+            if tools:
+                parts.append(_TOOLS_SECTION_OPEN)
+                for tool in tools:
+                    output = tool.get("output", "")
+                    if _is_blob_ref(output):
+                        # Only the preview is shown; a UTF-8 char is at most 4 bytes
+                        output = _load_blob(blob_path, output, _RESULT_PREVIEW_CHARS * 4 + 4)
+                    parts.append(
+                        _TOOL_ITEM.format(
+                            name=_escape(tool["name"]),
+                            latency_s=tool.get("latency_s", 0),
+                            args_json=_escape(dumps(tool.get("args", {}))),
+                            result=_escape(_preview(output)),
+                        )
+                    )
+                parts.append("</div>")
+
+            # Token Viz for this turn
+            if tokens:
+                breakdown = tokens.get("breakdown", {})
+                total_ctx = tokens.get("total_context", 0)
+
+                if total_ctx > 0:
+                    parts.append(
+                        _TOKEN_BOX_OPEN.format(
+                            total_ctx=total_ctx, utilization=total_ctx / 128000 * 100
+                        )
+                    )
+
+                    # One pass builds both the bar segments and the legend
+                    legend = ["<div class='legend'>"]
+                    for k, v in breakdown.items():
+                        if v > 0:
+                            pct = (v / total_ctx) * 100
+                            c = _TOKEN_COLORS.get(k, "#ccc")
+                            key = _escape(k)
+                            # Only show text if segment is wide enough
+                            label = str(v) if pct > 5 else ""
+                            parts.append(_TOKEN_SEG.format(key=key, value=v, pct=pct, color=c, label=label))
+                            legend.append(_LEGEND_ITEM.format(key=key, value=v, color=c))
+                    parts.append("</div>")
+
+                    # Legend
+                    parts.extend(legend)
+                    parts.append("</div></div>")
+
+            parts.append("</div>")  # Close turn-container
+
+        parts.append("</details>")
+        return "".join(parts)
@@ -1,32 +1,48 @@
-from typing import Dict, List
+import re
+from typing import Callable, Dict, List
 
+# Opt-out phrases; each check is a single case-insensitive scan of the body.
+# ASCII keeps case folding identical to matching against body.lower().
+_SMS_OPT_OUT_RE = re.compile(r"stop", re.IGNORECASE | re.ASCII)
+_EMAIL_OPT_OUT_RE = re.compile(r"opt|unsubscribe|reply stop", re.IGNORECASE | re.ASCII)
 
-def validate_response(expected: Dict, actual: Dict) -> List[str]:
-    """Compare critical fields between expected and actual output."""
-    errors = []
 
-    # Safe retrieval
+def make_validator(expected: Dict) -> Callable[[Dict], List[str]]:
+    """Builds a validator for one task's expected output.
+
+    The expected side is read once, so retries and repair turns of the same task
+    only inspect the actual output.
+    """
     exp_msg = expected.get("next_message", {}) or {}
-    act_msg = actual.get("next_message", {}) or {}
+    exp_channel = exp_msg.get("channel")
+
+    def validate(actual: Dict) -> List[str]:
+        errors = []
+
+        act_msg = actual.get("next_message", {}) or {}
+        channel = act_msg.get("channel")
 
-    # 1. Channel Validation
-    if exp_msg.get("channel") != act_msg.get("channel"):
-        errors.append(
-            f"Channel mismatch: Expected '{exp_msg.get('channel')}', got '{act_msg.get('channel')}'"
-        )
+        # 1. Channel Validation
+        if exp_channel != channel:
+            errors.append(
+                f"Channel mismatch: Expected '{exp_channel}', got '{channel}'"
+            )
 
-    # 2. Opt-out Instruction Validation
-    body = (act_msg.get("body") or "").lower()
-    channel = act_msg.get("channel")
+        # 2. Opt-out Instruction Validation
+        body = act_msg.get("body") or ""
 
-    if channel == "sms" and "stop" not in body:
-        errors.append("SMS missing opt-out 'STOP'")
+        if channel == "sms" and _SMS_OPT_OUT_RE.search(body) is None:
+            errors.append("SMS missing opt-out 'STOP'")
 
-    if channel == "email":
-        has_opt_out = any(
-            phrase in body for phrase in ["opt", "unsubscribe", "reply stop"]
-        )
-        if not has_opt_out:
-            errors.append("Email missing opt-out instructions")
+        if channel == "email":
+            if _EMAIL_OPT_OUT_RE.search(body) is None:
+                errors.append("Email missing opt-out instructions")
 
-    return errors
+        return errors
+
+    return validate
+
+
+def validate_response(expected: Dict, actual: Dict) -> List[str]:
+    """Compare critical fields between expected and actual output."""
+    return make_validator(expected)(actual)